@@ -1,7 +1,8 @@
 import io
 import logging
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 
 from flask import Flask, abort, jsonify, request, send_file, Response
 from flask_cors import CORS
@@ -10,6 +11,7 @@ from sqlalchemy.orm import scoped_session, sessionmaker
 
 from config import Config
 from models import Slide, engine
+from slide_analytics import STATS_PENDING, requeue_stale_analytics, submit_slide_analytics
 
 try:
     from openslide import OpenSlide
@@ -35,6 +37,11 @@ SessionLocal = scoped_session(
     sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
 )
 
+try:  # pragma: no cover - 重启前排队的统计任务随进程丢失，需重新提交
+    requeue_stale_analytics()
+except SQLAlchemyError as exc:
+    logger.warning("无法重新排队中断的统计任务：%s", exc)
+
 
 @app.teardown_appcontext
 def remove_session(exception=None):  # pragma: no cover - side effect only
@@ -67,11 +74,35 @@ def open_slide_resources(slide: Slide) -> Tuple["OpenSlide", "DeepZoomGenerator"
     return slide_obj, generator
 
 
+def parse_float_arg(name: str) -> Optional[float]:
+    value = request.args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        abort(400, description=f"{name} 必须是数字")
+
+
 @app.route("/api/slides", methods=["GET"])
 def list_slides():
+    range_filters = [
+        (Slide.tissue_fraction, parse_float_arg("min_tissue"), parse_float_arg("max_tissue")),
+        (Slide.focus_score, parse_float_arg("min_focus"), parse_float_arg("max_focus")),
+    ]
+    stats_status = request.args.get("stats_status")
+
     session = SessionLocal()
     try:
-        slides = session.query(Slide).order_by(Slide.created_at.desc()).all()
+        query = session.query(Slide)
+        for column, minimum, maximum in range_filters:
+            if minimum is not None:
+                query = query.filter(column >= minimum)
+            if maximum is not None:
+                query = query.filter(column <= maximum)
+        if stats_status:
+            query = query.filter(Slide.stats_status == stats_status)
+        slides = query.order_by(Slide.created_at.desc()).all()
         return jsonify([slide.to_dict() for slide in slides])
     except SQLAlchemyError as exc:  # pragma: no cover - runtime safeguard
         logger.exception("Failed to list slides")
@@ -117,10 +148,13 @@ def create_slide():
             description=description,
             file_path=file_path,
             slide_metadata=metadata,
+            stats_status=STATS_PENDING if Config.ANALYTICS_ENABLED else None,
+            stats_started_at=datetime.utcnow() if Config.ANALYTICS_ENABLED else None,
         )
         session.add(slide)
         session.commit()
         session.refresh(slide)
+        submit_slide_analytics(slide.id)
         return jsonify(slide.to_dict()), 201
     except SQLAlchemyError as exc:  # pragma: no cover
         session.rollback()
@@ -130,6 +164,24 @@ def create_slide():
         session.close()
 
 
+@app.route("/api/slides/<int:slide_id>/stats", methods=["GET"])
+def get_slide_stats(slide_id: int):
+    """Precomputed QC statistics; never opens the slide file."""
+    session = SessionLocal()
+    try:
+        slide = session.get(Slide, slide_id)
+        if not slide:
+            abort(404, description="切片不存在")
+        response = jsonify(slide.stats_dict())
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except SQLAlchemyError as exc:  # pragma: no cover
+        logger.exception("Failed to fetch stats for slide %s", slide_id)
+        abort(500, description=str(exc))
+    finally:
+        session.close()
+
+
 @app.route("/api/slides/<int:slide_id>/dzi", methods=["GET"])
 def get_slide_dzi(slide_id: int):
     session = SessionLocal()
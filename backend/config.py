@@ -24,6 +24,13 @@ class Config:
     DEEPZOOM_TILE_SIZE = int(os.environ.get("DEEPZOOM_TILE_SIZE", "256"))
     DEEPZOOM_OVERLAP = int(os.environ.get("DEEPZOOM_OVERLAP", "0"))
 
+    ANALYTICS_ENABLED = os.environ.get("ANALYTICS_ENABLED", "1") == "1"
+    ANALYTICS_WORKERS = int(os.environ.get("ANALYTICS_WORKERS", "1"))
+    ANALYTICS_DOWNSAMPLE = float(os.environ.get("ANALYTICS_DOWNSAMPLE", "8"))
+    ANALYTICS_FOCUS_CELL = int(os.environ.get("ANALYTICS_FOCUS_CELL", "128"))
+    # 超过该时长仍处于 pending/running 的统计任务视为中断，可重新排队
+    ANALYTICS_STALE_MINUTES = float(os.environ.get("ANALYTICS_STALE_MINUTES", "60"))
+
     @staticmethod
     def ensure_storage_path() -> Path:
         storage_path = Path(Config.SLIDE_STORAGE_PATH)
@@ -2,7 +2,7 @@ import logging
 from datetime import datetime
 from typing import Any, Dict
 
-from sqlalchemy import DateTime, Integer, String, Text, create_engine
+from sqlalchemy import DateTime, Float, Integer, String, Text, create_engine, text
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
@@ -29,6 +29,13 @@ class Slide(Base):
     slide_metadata: Mapped[Dict[str, Any] | None] = mapped_column(
         JSONB, nullable=True, default=dict, name="metadata"
     )
+    stats_status: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    stats_started_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    tissue_fraction: Mapped[float | None] = mapped_column(Float, nullable=True)
+    focus_score: Mapped[float | None] = mapped_column(Float, nullable=True)
+    slide_stats: Mapped[Dict[str, Any] | None] = mapped_column(
+        JSONB, nullable=True, name="stats"
+    )
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -38,12 +45,44 @@ class Slide(Base):
             "file_path": self.file_path,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "metadata": self.slide_metadata or {},
+            "stats_status": self.stats_status,
+            "tissue_fraction": self.tissue_fraction,
+            "focus_score": self.focus_score,
+        }
+
+    def stats_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.stats_status,
+            **(self.slide_stats or {}),
         }
 
 
 engine = create_engine(Config.DATABASE_URL, future=True)
 
-try:  # pragma: no cover - 连接可能在容器启动时暂不可用
+# create_all 不会给已存在的表补列；init.sql 也只在数据卷为空时执行，
+# 因此新增列需在此幂等补齐，保证旧部署升级后查询不报错。
+# 这里是新增列的唯一来源，init.sql 只保留初始表结构
+SCHEMA_UPGRADES = [
+    "ALTER TABLE slides ADD COLUMN IF NOT EXISTS stats_status VARCHAR(16)",
+    "ALTER TABLE slides ADD COLUMN IF NOT EXISTS stats_started_at TIMESTAMP",
+    "ALTER TABLE slides ADD COLUMN IF NOT EXISTS tissue_fraction DOUBLE PRECISION",
+    "ALTER TABLE slides ADD COLUMN IF NOT EXISTS focus_score DOUBLE PRECISION",
+    "ALTER TABLE slides ADD COLUMN IF NOT EXISTS stats JSONB",
+    "CREATE INDEX IF NOT EXISTS idx_slides_tissue_fraction ON slides (tissue_fraction)",
+    "CREATE INDEX IF NOT EXISTS idx_slides_focus_score ON slides (focus_score)",
+]
+
+
+def init_schema() -> None:
+    """Create missing tables and apply the idempotent column upgrades."""
     Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for statement in SCHEMA_UPGRADES:
+            connection.execute(text(statement))
+
+
+try:  # pragma: no cover - 连接可能在容器启动时暂不可用
+    init_schema()
 except OperationalError as exc:
     logger.warning("数据库暂不可用，稍后将自动创建表结构：%s", exc)
@@ -0,0 +1,637 @@
+"""Region-parallel pyramidal TIFF builder.
+
+``tiffsave(..., pyramid=True)`` walks the whole slide in one sequential pass.
+For very large scans this module instead cuts level 0 into square regions whose
+edge is ``tile_size * 2**k``, so every region can be shrunk ``k`` times while
+staying aligned to the tile grid of each level. Regions are decoded, shrunk and
+JPEG-encoded in a process pool; the coarse levels above ``k`` are built from the
+already-downsampled region outputs, and finally all tiles are stitched into a
+single tiled, multi-directory (Big)TIFF with the same level geometry libvips
+writes (odd edges rounded down), so OpenSlide opens it as a generic tiled TIFF.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import struct
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import pyvips  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    pyvips = None
+
+
+DEFAULT_TILE_SIZE = 256
+DEFAULT_JPEG_QUALITY = 90
+DEFAULT_REGION_SHRINKS = 4  # 256 * 2**4 = 4096 像素见方的区域
+DEFAULT_MEMORY_BUDGET_MB = 2048
+
+# 区域解码后的像素 + 各级缩小图 + libvips 缓冲的粗略放大系数
+_REGION_MEMORY_FACTOR = 2.0
+_CLASSIC_TIFF_LIMIT = 2**32 - 2**24
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[str, int, int], None]
+
+# (level, tile_x, tile_y, offset, length)
+TileIndex = List[Tuple[int, int, int, int, int]]
+
+
+@dataclass
+class RegionResult:
+    row: int
+    col: int
+    blob_path: str
+    tiles: TileIndex
+    level_sizes: List[Tuple[int, int]]
+    carry_path: Optional[str]
+    decode_seconds: float
+    encode_seconds: float
+
+
+@dataclass
+class PyramidReport:
+    output_path: Path
+    width: int
+    height: int
+    level_count: int
+    region_count: int
+    workers: int
+    region_size: int
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "output_path": str(self.output_path),
+            "width": self.width,
+            "height": self.height,
+            "level_count": self.level_count,
+            "region_count": self.region_count,
+            "workers": self.workers,
+            "region_size": self.region_size,
+            "timings": {name: round(value, 3) for name, value in self.timings.items()},
+        }
+
+
+def log_progress(stage: str, done: int, total: int) -> None:
+    logger.info("[%s] %d/%d", stage, done, total)
+
+
+def count_levels(width: int, height: int, tile_size: int) -> int:
+    """Pyramid depth using libvips' rule: halve (rounding down) while either side
+    exceeds a tile and both sides can still be halved."""
+    levels = 1
+    while (width > tile_size or height > tile_size) and width >= 2 and height >= 2:
+        width, height = width // 2, height // 2
+        levels += 1
+    return levels
+
+
+def split_extent(extent: int, size: int, minimum: int) -> List[Tuple[int, int]]:
+    """Cut ``extent`` into ``(start, length)`` spans of ``size``.
+
+    A tail shorter than ``minimum`` is merged into the previous span, so no
+    region disappears when its edge is halved (rounding down) ``log2(minimum)``
+    times.
+    """
+    spans = [(start, min(size, extent - start)) for start in range(0, extent, size)]
+    if len(spans) > 1 and spans[-1][1] < minimum:
+        start, length = spans[-2]
+        spans[-2:] = [(start, length + spans[-1][1])]
+    return spans
+
+
+def plan_region_shrinks(
+    bands: int, tile_size: int, memory_budget: int, max_shrinks: int
+) -> int:
+    """Pick the largest region edge that a single worker can hold within the budget."""
+    shrinks = max_shrinks
+    while shrinks > 0 and region_memory(tile_size << shrinks, bands) > memory_budget:
+        shrinks -= 1
+    return shrinks
+
+
+def plan_pool_size(
+    region_size: int, bands: int, workers: int, region_count: int, memory_budget: int
+) -> int:
+    """Cap the process count so that concurrent regions stay within the budget."""
+    fitting = memory_budget // region_memory(region_size, bands)
+    return max(1, min(workers, region_count, fitting))
+
+
+def region_memory(edge: int, bands: int) -> int:
+    return int(edge * edge * bands * _REGION_MEMORY_FACTOR)
+
+
+def _normalise(image: "pyvips.Image") -> "pyvips.Image":
+    if image.hasalpha():
+        image = image.flatten(background=[255] * (image.bands - 1))
+    if image.bands not in (1, 3):
+        image = image.extract_band(0, n=3) if image.bands > 3 else image.extract_band(0)
+    if image.format != "uchar":
+        image = image.cast("uchar")
+    return image
+
+
+def open_source(path: Path) -> "pyvips.Image":
+    return _normalise(pyvips.Image.new_from_file(str(path)))
+
+
+def encode_level_tiles(
+    image: "pyvips.Image",
+    level: int,
+    tile_size: int,
+    quality: int,
+    blob: BinaryIO,
+    tile_origin: Tuple[int, int] = (0, 0),
+) -> TileIndex:
+    """JPEG-encode ``image`` tile by tile, appending the bytes to ``blob``."""
+    tiles: TileIndex = []
+    origin_x, origin_y = tile_origin
+    for ty in range(math.ceil(image.height / tile_size)):
+        for tx in range(math.ceil(image.width / tile_size)):
+            left, top = tx * tile_size, ty * tile_size
+            width = min(tile_size, image.width - left)
+            height = min(tile_size, image.height - top)
+            tile = image.crop(left, top, width, height)
+            if width != tile_size or height != tile_size:
+                tile = tile.embed(0, 0, tile_size, tile_size, extend="white")
+            data = tile.jpegsave_buffer(Q=quality, subsample_mode="off", strip=True)
+            offset = blob.tell()
+            blob.write(data)
+            tiles.append((level, origin_x + tx, origin_y + ty, offset, len(data)))
+    return tiles
+
+
+_worker_source: Optional["pyvips.Image"] = None
+
+
+@contextmanager
+def _single_threaded_vips() -> Iterator[None]:
+    """Make spawned workers start libvips with one thread.
+
+    libvips reads ``VIPS_CONCURRENCY`` when the child imports pyvips, i.e. before
+    the pool initializer runs, and the pinned pyvips has no ``concurrency_set``.
+    """
+    previous = os.environ.get("VIPS_CONCURRENCY")
+    os.environ["VIPS_CONCURRENCY"] = "1"
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop("VIPS_CONCURRENCY", None)
+        else:
+            os.environ["VIPS_CONCURRENCY"] = previous
+
+
+def _init_worker(source_path: str) -> None:
+    global _worker_source
+    # 并行度由进程池控制：每个进程只用一个 libvips 线程（见 _single_threaded_vips），
+    # 且不保留操作缓存
+    pyvips.cache_set_max(0)
+    _worker_source = open_source(Path(source_path))
+
+
+def _encode_region(
+    image: "pyvips.Image",
+    row: int,
+    col: int,
+    region_size: int,
+    level_offset: int,
+    encode_first: bool,
+    shrinks: int,
+    tile_size: int,
+    quality: int,
+    work_dir: str,
+    keep_carry: bool,
+) -> RegionResult:
+    """Encode ``image`` (one region at ``level_offset``) and its ``shrinks`` reductions.
+
+    ``region_size`` is the nominal region edge at ``level_offset``; when
+    ``keep_carry`` is set the smallest reduction is kept as a ``.v`` file so the
+    next pass can continue the pyramid from it.
+    """
+    first_level = level_offset if encode_first else level_offset + 1
+    blob_path = os.path.join(work_dir, f"region_{first_level}_{row}_{col}.bin")
+    carry_path = None
+    tiles: TileIndex = []
+    level_sizes: List[Tuple[int, int]] = []
+    started = time.perf_counter()
+    with open(blob_path, "wb") as blob:
+        for step in range(shrinks + 1):
+            if step:
+                # 与 libvips 金字塔一致：奇数边向下取整
+                width, height = image.width // 2, image.height // 2
+                image = image.shrink(2, 2).crop(0, 0, width, height).copy_memory()
+            level_sizes.append((image.width, image.height))
+            if step or encode_first:
+                region_edge = region_size >> step
+                origin = (col * region_edge // tile_size, row * region_edge // tile_size)
+                tiles.extend(
+                    encode_level_tiles(
+                        image, level_offset + step, tile_size, quality, blob, origin
+                    )
+                )
+    if keep_carry:
+        carry_path = os.path.join(
+            work_dir, f"carry_{level_offset + shrinks}_{row}_{col}.v"
+        )
+        image.write_to_file(carry_path)
+    encode_seconds = time.perf_counter() - started
+
+    return RegionResult(
+        row=row,
+        col=col,
+        blob_path=blob_path,
+        tiles=tiles,
+        level_sizes=level_sizes,
+        carry_path=carry_path,
+        decode_seconds=0.0,
+        encode_seconds=encode_seconds,
+    )
+
+
+def _build_region(
+    row: int,
+    col: int,
+    span: Tuple[int, int, int, int],
+    region_size: int,
+    shrinks: int,
+    tile_size: int,
+    quality: int,
+    work_dir: str,
+    keep_carry: bool,
+) -> RegionResult:
+    source = _worker_source
+    left, top, width, height = span
+
+    started = time.perf_counter()
+    image = source.crop(left, top, width, height).copy_memory()
+    decode_seconds = time.perf_counter() - started
+
+    result = _encode_region(
+        image, row, col, region_size, 0, True, shrinks,
+        tile_size, quality, work_dir, keep_carry,
+    )
+    result.decode_seconds = decode_seconds
+    return result
+
+
+def _join_carries(pieces: List[List[str]]) -> "pyvips.Image":
+    """Load a block of carry pieces (row-major) as one in-memory image."""
+    images = [[pyvips.Image.new_from_file(path) for path in row] for row in pieces]
+    width = sum(image.width for image in images[0])
+    height = sum(row[0].height for row in images)
+    joined = pyvips.Image.arrayjoin(
+        [image for row in images for image in row], across=len(images[0])
+    )
+    # arrayjoin 按最大尺寸对齐网格；边缘块较小，裁掉右侧/底部的填充
+    return joined.crop(0, 0, width, height).copy_memory()
+
+
+def _pass_level_sizes(
+    results: List[RegionResult], steps: range
+) -> List[Tuple[int, int]]:
+    """Level sizes = widths summed along the first region row x heights down the first column."""
+    return [
+        (
+            sum(r.level_sizes[step][0] for r in results if r.row == 0),
+            sum(r.level_sizes[step][1] for r in results if r.col == 0),
+        )
+        for step in steps
+    ]
+
+
+class TiffWriter:
+    """Minimal writer for tiled, JPEG-compressed, multi-directory (Big)TIFF."""
+
+    def __init__(self, handle: BinaryIO, bigtiff: bool) -> None:
+        self.handle = handle
+        self.bigtiff = bigtiff
+        if bigtiff:
+            handle.write(b"II" + struct.pack("<HHHQ", 43, 8, 0, 0))
+            self._next_pointer = 8
+        else:
+            handle.write(b"II" + struct.pack("<HI", 42, 0))
+            self._next_pointer = 4
+
+    def _align(self) -> int:
+        position = self.handle.tell()
+        if position % 2:
+            self.handle.write(b"\0")
+            position += 1
+        return position
+
+    def _pack(self, type_id: int, values: List[object]) -> bytes:
+        if type_id == 2:
+            return values[0].encode("ascii") + b"\0"  # type: ignore[union-attr]
+        if type_id == 5:
+            return b"".join(struct.pack("<II", num, den) for num, den in values)  # type: ignore[misc]
+        code = {3: "H", 4: "I", 16: "Q"}[type_id]
+        return struct.pack(f"<{len(values)}{code}", *values)
+
+    def write_directory(self, entries: Dict[int, Tuple[int, List[object]]]) -> None:
+        inline = 8 if self.bigtiff else 4
+        packed = []
+        for tag in sorted(entries):
+            type_id, values = entries[tag]
+            data = self._pack(type_id, values)
+            count = len(data) if type_id == 2 else len(values)
+            if len(data) > inline:
+                offset = self._align()
+                self.handle.write(data)
+                data = struct.pack("<Q" if self.bigtiff else "<I", offset)
+            packed.append((tag, type_id, count, data.ljust(inline, b"\0")))
+
+        directory = self._align()
+        if self.bigtiff:
+            self.handle.write(struct.pack("<Q", len(packed)))
+            for tag, type_id, count, data in packed:
+                self.handle.write(struct.pack("<HHQ", tag, type_id, count) + data)
+            next_pointer = self.handle.tell()
+            self.handle.write(struct.pack("<Q", 0))
+        else:
+            self.handle.write(struct.pack("<H", len(packed)))
+            for tag, type_id, count, data in packed:
+                self.handle.write(struct.pack("<HHI", tag, type_id, count) + data)
+            next_pointer = self.handle.tell()
+            self.handle.write(struct.pack("<I", 0))
+
+        end = self.handle.tell()
+        self.handle.seek(self._next_pointer)
+        self.handle.write(struct.pack("<Q" if self.bigtiff else "<I", directory))
+        self.handle.seek(end)
+        self._next_pointer = next_pointer
+
+
+def level_directory(
+    level: int,
+    width: int,
+    height: int,
+    bands: int,
+    tile_size: int,
+    offsets: List[int],
+    lengths: List[int],
+    bigtiff: bool,
+    resolution: Optional[Tuple[float, float]] = None,
+) -> Dict[int, Tuple[int, List[object]]]:
+    entries: Dict[int, Tuple[int, List[object]]] = {
+        254: (4, [0 if level == 0 else 1]),  # NewSubfileType: reduced-resolution
+        256: (4, [width]),
+        257: (4, [height]),
+        258: (3, [8] * bands),
+        259: (3, [7]),  # JPEG
+        262: (3, [6 if bands == 3 else 1]),  # YCbCr / MinIsBlack
+        277: (3, [bands]),
+        284: (3, [1]),
+        322: (3, [tile_size]),
+        323: (3, [tile_size]),
+        324: (16 if bigtiff else 4, offsets),
+        325: (4, lengths),
+    }
+    if bands == 3:
+        entries[530] = (3, [1, 1])  # 与 subsample_mode="off" 的 JPEG 流一致
+    if resolution:
+        scale = 2**level
+        entries[282] = (5, [(max(1, round(resolution[0] * 1000 / scale)), 1000)])
+        entries[283] = (5, [(max(1, round(resolution[1] * 1000 / scale)), 1000)])
+        entries[296] = (3, [3])  # 像素/厘米
+    return entries
+
+
+def build_pyramid(
+    input_path: Path,
+    output_path: Path,
+    workers: Optional[int] = None,
+    memory_budget_mb: int = DEFAULT_MEMORY_BUDGET_MB,
+    tile_size: int = DEFAULT_TILE_SIZE,
+    quality: int = DEFAULT_JPEG_QUALITY,
+    max_region_shrinks: int = DEFAULT_REGION_SHRINKS,
+    progress: ProgressCallback = log_progress,
+) -> PyramidReport:
+    """Build a pyramidal TIFF from ``input_path`` using a bounded process pool."""
+    if pyvips is None:
+        raise RuntimeError("pyvips is not available")
+
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    source = open_source(input_path)
+    width, height, bands = source.width, source.height, source.bands
+    resolution = (source.xres * 10, source.yres * 10) if source.xres > 1 else None
+    level_count = count_levels(width, height, tile_size)
+
+    memory_budget = memory_budget_mb * 1024 * 1024
+    requested = max(1, workers or os.cpu_count() or 1)
+    # 预算不足时先减少进程数，只有单个进程也放不下时才缩小区域
+    shrinks = min(
+        plan_region_shrinks(bands, tile_size, memory_budget, max_region_shrinks),
+        level_count - 1,
+    )
+    region_size = tile_size << shrinks
+    column_spans = split_extent(width, region_size, 1 << shrinks)
+    row_spans = split_extent(height, region_size, 1 << shrinks)
+    region_count = len(row_spans) * len(column_spans)
+    pool_size = plan_pool_size(region_size, bands, requested, region_count, memory_budget)
+    timings["plan"] = time.perf_counter() - started
+    logger.info(
+        "%s: %dx%d, %d 层, %d 个 %dpx 区域, %d 个进程",
+        input_path.name, width, height, level_count, region_count, region_size, pool_size,
+    )
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=f".{output_path.stem}-", dir=output_path.parent)
+    try:
+        started = time.perf_counter()
+        results = _build_regions(
+            input_path, row_spans, column_spans, region_size, shrinks, tile_size, quality,
+            work_dir, shrinks < level_count - 1, pool_size, progress,
+        )
+        timings["regions"] = time.perf_counter() - started
+        timings["region_decode_cpu"] = sum(result.decode_seconds for result in results)
+        timings["region_encode_cpu"] = sum(result.encode_seconds for result in results)
+        level_sizes = _pass_level_sizes(results, range(shrinks + 1))
+
+        started = time.perf_counter()
+        coarse_results = _build_coarse_levels(
+            results, shrinks, level_count, tile_size, quality,
+            work_dir, level_sizes, progress,
+        )
+        timings["coarse_levels"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        blobs = [(r.blob_path, r.tiles) for r in results + coarse_results]
+        _assemble(output_path, blobs, level_sizes, bands, tile_size, resolution, progress)
+        timings["assemble"] = time.perf_counter() - started
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    timings["total"] = sum(
+        timings[name] for name in ("plan", "regions", "coarse_levels", "assemble")
+    )
+    report = PyramidReport(
+        output_path=output_path,
+        width=width,
+        height=height,
+        level_count=len(level_sizes),
+        region_count=region_count,
+        workers=pool_size,
+        region_size=region_size,
+        timings=timings,
+    )
+    logger.info("金字塔生成完成：%s", report.to_dict())
+    return report
+
+
+def _build_regions(
+    input_path: Path,
+    row_spans: List[Tuple[int, int]],
+    column_spans: List[Tuple[int, int]],
+    region_size: int,
+    shrinks: int,
+    tile_size: int,
+    quality: int,
+    work_dir: str,
+    keep_carry: bool,
+    pool_size: int,
+    progress: ProgressCallback,
+) -> List[RegionResult]:
+    """Decode and encode every level-0 region in a spawned process pool."""
+    results: List[RegionResult] = []
+    # libvips 的线程池在 fork 后会死锁，工作进程必须用 spawn 启动
+    with _single_threaded_vips(), ProcessPoolExecutor(
+        max_workers=pool_size,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(str(input_path),),
+    ) as executor:
+        futures = [
+            executor.submit(
+                _build_region, row, col, (left, top, width, height), region_size,
+                shrinks, tile_size, quality, work_dir, keep_carry,
+            )
+            for row, (top, height) in enumerate(row_spans)
+            for col, (left, width) in enumerate(column_spans)
+        ]
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                results.append(future.result())
+                progress("regions", done, len(futures))
+        except BaseException:
+            # 任一区域失败即放弃排队中的区域，尽快回退
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    results.sort(key=lambda result: (result.row, result.col))
+    return results
+
+
+def _build_coarse_levels(
+    results: List[RegionResult],
+    shrinks: int,
+    level_count: int,
+    tile_size: int,
+    quality: int,
+    work_dir: str,
+    level_sizes: List[Tuple[int, int]],
+    progress: ProgressCallback,
+) -> List[RegionResult]:
+    """Continue the pyramid from the tile-sized carry pieces, one region at a time.
+
+    Each pass groups ``2**n x 2**n`` carry pieces into a region, shrinks it ``n``
+    times and leaves tile-sized carries for the next pass, so memory stays at one
+    region no matter how large the carry mosaic is. ``level_sizes`` is extended
+    in place.
+    """
+    coarse_results: List[RegionResult] = []
+    pieces = {(r.row, r.col): r.carry_path for r in results}
+    top = shrinks
+    while top < level_count - 1:
+        step_count = min(max(shrinks, 1), level_count - 1 - top)
+        region_size = tile_size << step_count
+        keep_carry = top + step_count < level_count - 1
+        # 碎片除最后一行/列外均为整瓦片大小，按像素切分即可换算出碎片下标
+        level_width, level_height = level_sizes[top]
+        column_spans = split_extent(level_width, region_size, 1 << step_count)
+        row_spans = split_extent(level_height, region_size, 1 << step_count)
+        pass_results: List[RegionResult] = []
+        for row, (y, height) in enumerate(row_spans):
+            for col, (x, width) in enumerate(column_spans):
+                block = [
+                    [
+                        pieces[(r, c)]
+                        for c in range(x // tile_size, math.ceil((x + width) / tile_size))
+                    ]
+                    for r in range(y // tile_size, math.ceil((y + height) / tile_size))
+                ]
+                image = _join_carries(block)
+                pass_results.append(
+                    _encode_region(
+                        image, row, col, region_size, top, False, step_count,
+                        tile_size, quality, work_dir, keep_carry,
+                    )
+                )
+                for path in (path for block_row in block for path in block_row):
+                    os.remove(path)
+        level_sizes.extend(_pass_level_sizes(pass_results, range(1, step_count + 1)))
+        coarse_results.extend(pass_results)
+        pieces = {(r.row, r.col): r.carry_path for r in pass_results}
+        top += step_count
+        progress("coarse_levels", top - shrinks, level_count - 1 - shrinks)
+    return coarse_results
+
+
+def _assemble(
+    output_path: Path,
+    blobs: List[Tuple[str, TileIndex]],
+    level_sizes: List[Tuple[int, int]],
+    bands: int,
+    tile_size: int,
+    resolution: Optional[Tuple[float, float]],
+    progress: ProgressCallback,
+) -> None:
+    grids = [
+        (math.ceil(w / tile_size), math.ceil(h / tile_size)) for w, h in level_sizes
+    ]
+    offsets = [[0] * (across * down) for across, down in grids]
+    lengths = [[0] * (across * down) for across, down in grids]
+    payload = sum(os.path.getsize(path) for path, _ in blobs)
+    bigtiff = payload >= _CLASSIC_TIFF_LIMIT
+
+    partial_path = output_path.with_name(output_path.name + ".partial")
+    try:
+        with open(partial_path, "wb") as handle:
+            writer = TiffWriter(handle, bigtiff)
+            for done, (path, tiles) in enumerate(blobs, start=1):
+                base = handle.tell()
+                with open(path, "rb") as blob:
+                    shutil.copyfileobj(blob, handle, 16 * 1024 * 1024)
+                for level, tx, ty, offset, length in tiles:
+                    index = ty * grids[level][0] + tx
+                    offsets[level][index] = base + offset
+                    lengths[level][index] = length
+                os.remove(path)
+                progress("assemble", done, len(blobs))
+
+            for level, (level_width, level_height) in enumerate(level_sizes):
+                writer.write_directory(
+                    level_directory(
+                        level, level_width, level_height, bands, tile_size,
+                        offsets[level], lengths[level], bigtiff, resolution,
+                    )
+                )
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
+    os.replace(partial_path, output_path)
@@ -0,0 +1,190 @@
+"""Background jobs for per-slide QC analytics.
+
+The statistics (see ``slide_stats``) are computed once per slide and stored on
+the ``Slide`` row so that API consumers never need to decode the slide again.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import sessionmaker
+
+from config import Config
+from models import Slide, engine
+from slide_stats import compute_slide_stats
+
+
+STATS_PENDING = "pending"
+STATS_RUNNING = "running"
+STATS_READY = "ready"
+STATS_FAILED = "failed"
+
+logger = logging.getLogger(__name__)
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _stale_before() -> datetime:
+    return datetime.utcnow() - timedelta(minutes=Config.ANALYTICS_STALE_MINUTES)
+
+
+def _is_stale(stale_before: datetime):
+    """Rows whose queued or running job has not reported back in time."""
+    return or_(Slide.stats_started_at.is_(None), Slide.stats_started_at < stale_before)
+
+
+def run_slide_analytics(slide_id: int) -> Optional[str]:
+    """Compute statistics for ``slide_id`` and persist them; return the status.
+
+    The row is claimed atomically, so a slide already running in another
+    process is skipped (its current status is returned) unless that job is stale.
+    """
+    session = SessionLocal()
+    try:
+        claim = (
+            update(Slide)
+            .where(
+                Slide.id == slide_id,
+                or_(
+                    Slide.stats_status.is_(None),
+                    Slide.stats_status != STATS_RUNNING,
+                    _is_stale(_stale_before()),
+                ),
+            )
+            .values(stats_status=STATS_RUNNING, stats_started_at=datetime.utcnow())
+        )
+        claimed = session.execute(claim).rowcount
+        session.commit()
+
+        slide = session.get(Slide, slide_id)
+        if not slide:
+            logger.warning("切片 %s 不存在，跳过统计", slide_id)
+            return None
+        if not claimed:
+            logger.info("切片 %s 正在由其他任务统计，跳过", slide_id)
+            return slide.stats_status
+
+        try:
+            stats = compute_slide_stats(Config.ensure_storage_path() / slide.file_path)
+        except Exception:
+            logger.exception("Failed to compute statistics for slide %s", slide_id)
+            slide.stats_status = STATS_FAILED
+            session.commit()
+            return STATS_FAILED
+
+        slide.tissue_fraction = stats["tissue_fraction"]
+        slide.focus_score = stats["focus_score"]
+        slide.slide_stats = stats
+        slide.stats_status = STATS_READY
+        session.commit()
+        return STATS_READY
+    except Exception:  # pragma: no cover - background job safeguard
+        session.rollback()
+        logger.exception("Failed to store statistics for slide %s", slide_id)
+        return STATS_FAILED
+    finally:
+        session.close()
+
+
+def submit_slide_analytics(slide_id: int) -> Optional[Future]:
+    """Queue ``run_slide_analytics`` on the shared background pool."""
+    global _executor
+    if not Config.ANALYTICS_ENABLED:
+        return None
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=Config.ANALYTICS_WORKERS, thread_name_prefix="slide-analytics"
+        )
+    return _executor.submit(run_slide_analytics, slide_id)
+
+
+def requeue_stale_analytics() -> List[int]:
+    """Re-submit pending/running jobs lost with a previous process; return their IDs.
+
+    Jobs live in an in-process queue, so a restart leaves their rows pending
+    forever. Rows are re-stamped in one ``UPDATE`` so that concurrent workers
+    never queue the same slide twice.
+    """
+    if not Config.ANALYTICS_ENABLED:
+        return []
+    session = SessionLocal()
+    try:
+        requeue = (
+            update(Slide)
+            .where(
+                Slide.stats_status.in_((STATS_PENDING, STATS_RUNNING)),
+                _is_stale(_stale_before()),
+            )
+            .values(stats_status=STATS_PENDING, stats_started_at=datetime.utcnow())
+            .returning(Slide.id)
+        )
+        slide_ids = list(session.scalars(requeue))
+        session.commit()
+    finally:
+        session.close()
+
+    for slide_id in slide_ids:
+        submit_slide_analytics(slide_id)
+    if slide_ids:
+        logger.info("重新排队 %d 个中断的统计任务", len(slide_ids))
+    return slide_ids
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="计算切片的组织面积、颜色直方图与清晰度热图")
+    parser.add_argument("slide_ids", type=int, nargs="*", help="待统计的切片 ID")
+    parser.add_argument(
+        "--missing",
+        action="store_true",
+        help="统计所有尚未成功计算且不在进行中的切片",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    args = parse_args(argv)
+    slide_ids = list(args.slide_ids)
+    if args.missing:
+        session = SessionLocal()
+        try:
+            slide_ids += [
+                slide_id
+                for (slide_id,) in session.query(Slide.id).filter(
+                    or_(
+                        Slide.stats_status.is_(None),
+                        Slide.stats_status == STATS_FAILED,
+                        Slide.stats_status.in_((STATS_PENDING, STATS_RUNNING))
+                        & _is_stale(_stale_before()),
+                    )
+                )
+            ]
+        finally:
+            session.close()
+
+    exit_code = 0
+    for slide_id in slide_ids:
+        status = run_slide_analytics(slide_id)
+        if status == STATS_READY:
+            print(f"✅ 切片 {slide_id} 统计完成")
+        elif status == STATS_RUNNING:
+            print(f"切片 {slide_id} 正在由其他任务统计，已跳过")
+        else:
+            print(f"切片 {slide_id} 统计失败", file=sys.stderr)
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":  # pragma: no cover - CLI entry point
+    raise SystemExit(main())
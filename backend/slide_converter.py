@@ -15,8 +15,9 @@ try:
 except ImportError:  # pragma: no cover - optional dependency
     pyvips = None
 
+from pyramid_builder import DEFAULT_MEMORY_BUDGET_MB, DEFAULT_TILE_SIZE, build_pyramid
+
 
-DEFAULT_TILE_SIZE = 256
 DEFAULT_OVERLAP = 0
 
 logger = logging.getLogger(__name__)
@@ -77,13 +78,42 @@ def convert_with_vips_cli(input_path: Path, output_path: Path) -> Path:
     return output_path
 
 
-def convert_kfb(input_path: Path, output_dir: Path) -> Path:
+def convert_with_pyramid_builder(
+    input_path: Path,
+    output_path: Path,
+    workers: Optional[int] = None,
+    memory_budget_mb: int = DEFAULT_MEMORY_BUDGET_MB,
+) -> Path:
+    report = build_pyramid(
+        input_path,
+        output_path,
+        workers=workers,
+        memory_budget_mb=memory_budget_mb,
+        tile_size=DEFAULT_TILE_SIZE,
+    )
+    return report.output_path
+
+
+def convert_kfb(
+    input_path: Path,
+    output_dir: Path,
+    parallel: bool = False,
+    workers: Optional[int] = None,
+    memory_budget_mb: int = DEFAULT_MEMORY_BUDGET_MB,
+) -> Path:
     output_dir = ensure_output_dir(output_dir)
     input_path = ensure_input(input_path)
     output_path = output_dir / f"{input_path.stem}.tif"
 
     try:
         if pyvips is not None:
+            if parallel:
+                try:
+                    return convert_with_pyramid_builder(
+                        input_path, output_path, workers, memory_budget_mb
+                    )
+                except Exception as exc:  # pragma: no cover - 容错处理
+                    logger.warning("并行金字塔生成失败，回退到单次 tiffsave：%s", exc)
             try:
                 return convert_with_pyvips(input_path, output_path)
             except Exception as exc:  # pragma: no cover - 容错处理
@@ -125,6 +155,23 @@ def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
         action="store_true",
         help="同时生成 DeepZoom (DZI) 切片，用于离线查看",
     )
+    parser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="按区域切分并用多进程并行生成金字塔，适用于超大切片",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="并行模式下的最大进程数（默认: CPU 核数）",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=DEFAULT_MEMORY_BUDGET_MB,
+        help=f"并行模式下所有进程的内存预算，单位 MB（默认: {DEFAULT_MEMORY_BUDGET_MB}）",
+    )
     return parser.parse_args(argv)
 
 
@@ -135,7 +182,13 @@ def main(argv: Optional[list[str]] = None) -> int:
     args = parse_args(argv)
 
     try:
-        tiff_path = convert_kfb(args.input, args.output_dir)
+        tiff_path = convert_kfb(
+            args.input,
+            args.output_dir,
+            parallel=args.parallel,
+            workers=args.workers,
+            memory_budget_mb=args.memory_budget,
+        )
         print(f"✅ 生成金字塔 TIFF: {tiff_path}")
 
         if args.dzi:
@@ -0,0 +1,188 @@
+"""Slide QC statistics: tissue fraction, colour histograms and focus map.
+
+Pure NumPy/OpenSlide code with no database access; ``slide_analytics`` runs it
+as a background job and stores the result on the ``Slide`` row.
+"""
+
+from __future__ import annotations
+
+import math
+import warnings
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+
+from config import Config
+
+try:
+    from openslide import OpenSlide
+except ImportError:  # pragma: no cover - handled gracefully at runtime
+    OpenSlide = None
+
+
+# 饱和度高于阈值且不过亮的像素视为组织
+TISSUE_SATURATION = 0.07
+TISSUE_MAX_GRAY = 220
+TISSUE_MIN_VALUE = 20
+# 组织占比低于该值的网格不参与清晰度统计
+FOCUS_MIN_TISSUE = 0.25
+# 清晰度只在组织内部计算：掩膜收缩的像素数，排除组织/背景交界处的强边缘
+FOCUS_EROSION = 2
+# 金字塔层级的下采样率常略大于整数倍（奇数边向下取整），选层时留出余量
+_LEVEL_TOLERANCE = 1.01
+
+
+def _read_chunk(slide: "OpenSlide", level: int, x: int, y: int, w: int, h: int) -> np.ndarray:
+    downsample = slide.level_downsamples[level]
+    location = (int(round(x * downsample)), int(round(y * downsample)))
+    rgba = np.asarray(slide.read_region(location, level, (w, h)))
+    rgb = rgba[..., :3].copy()
+    rgb[rgba[..., 3] == 0] = 255  # 切片外的透明区域按背景处理
+    return rgb
+
+
+def _box_reduce(rgb: np.ndarray, factor: int) -> np.ndarray:
+    """Average ``factor`` x ``factor`` blocks, dropping partial blocks like libvips."""
+    if factor == 1:
+        return rgb
+    height, width = rgb.shape[0] // factor, rgb.shape[1] // factor
+    blocks = rgb[:height * factor, :width * factor].reshape(
+        height, factor, width, factor, rgb.shape[2]
+    )
+    return blocks.mean(axis=(1, 3), dtype=np.float32).round().astype(np.uint8)
+
+
+def _erode(mask: np.ndarray, radius: int) -> np.ndarray:
+    """Shrink ``mask`` by ``radius`` pixels (4-neighbourhood); outside counts as empty."""
+    for _ in range(radius):
+        padded = np.pad(mask, 1, constant_values=False)
+        mask = (
+            mask
+            & padded[:-2, 1:-1]
+            & padded[2:, 1:-1]
+            & padded[1:-1, :-2]
+            & padded[1:-1, 2:]
+        )
+    return mask
+
+
+def _cell_view(values: np.ndarray, cell: int, fill: float) -> np.ndarray:
+    """Pad ``values`` to whole cells and return a ``(rows, cols, cell*cell)`` view."""
+    height, width = values.shape
+    rows, cols = math.ceil(height / cell), math.ceil(width / cell)
+    padded = np.full((rows * cell, cols * cell), fill, dtype=values.dtype)
+    padded[:height, :width] = values
+    return padded.reshape(rows, cell, cols, cell).swapaxes(1, 2).reshape(rows, cols, -1)
+
+
+def analyse_chunk(rgb: np.ndarray, cell: int) -> Dict[str, np.ndarray]:
+    channels = rgb.astype(np.float32)
+    high = channels.max(axis=2)
+    low = channels.min(axis=2)
+    gray = channels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    saturation = (high - low) / np.maximum(high, 1.0)
+    tissue = (
+        (saturation > TISSUE_SATURATION)
+        & (gray < TISSUE_MAX_GRAY)
+        & (high > TISSUE_MIN_VALUE)
+    )
+
+    histograms = np.stack(
+        [np.bincount(rgb[..., band][tissue], minlength=256) for band in range(3)]
+    )
+
+    padded = np.pad(gray, 1, mode="edge")
+    laplacian = (
+        4 * padded[1:-1, 1:-1]
+        - padded[:-2, 1:-1]
+        - padded[2:, 1:-1]
+        - padded[1:-1, :-2]
+        - padded[1:-1, 2:]
+    )
+    interior = _erode(tissue, FOCUS_EROSION)
+    laplacian[~interior] = np.nan
+    cell_tissue = _cell_view(interior.astype(np.float32), cell, np.nan)
+    cell_laplacian = _cell_view(laplacian, cell, np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)  # 全为填充值的网格
+        tissue_share = np.nanmean(cell_tissue, axis=2)
+        sharpness = np.nanvar(cell_laplacian, axis=2)
+    sharpness[~(tissue_share >= FOCUS_MIN_TISSUE)] = np.nan
+
+    return {
+        "tissue_pixels": np.count_nonzero(tissue),
+        "pixels": tissue.size,
+        "histograms": histograms,
+        "focus": sharpness,
+    }
+
+
+def compute_slide_stats(
+    slide_path: Path,
+    downsample: float = Config.ANALYTICS_DOWNSAMPLE,
+    cell_size: int = Config.ANALYTICS_FOCUS_CELL,
+    chunk_cells: int = 16,
+) -> Dict[str, Any]:
+    """Summarise ``slide_path`` at ``downsample``, streaming it in chunks.
+
+    The coarsest level not beyond ``downsample`` is read and box-reduced by the
+    remaining integer factor, so pyramidal and single-level files of the same
+    image are analysed at the same scale.
+    """
+    if OpenSlide is None:
+        raise RuntimeError("OpenSlide libraries are not available in this environment")
+
+    slide = OpenSlide(str(slide_path))
+    try:
+        level = slide.get_best_level_for_downsample(downsample * _LEVEL_TOLERANCE)
+        level_downsample = float(slide.level_downsamples[level])
+        level_width, level_height = slide.level_dimensions[level]
+        factor = max(1, min(round(downsample / level_downsample), level_width, level_height))
+        width, height = level_width // factor, level_height // factor
+        # 每块读取的层级像素约为 cell_size * chunk_cells 见方，与 factor 无关
+        chunk = cell_size * max(1, chunk_cells // factor)
+        focus_map = np.full(
+            (math.ceil(height / cell_size), math.ceil(width / cell_size)), np.nan
+        )
+        histograms = np.zeros((3, 256), dtype=np.int64)
+        tissue_pixels = 0
+        pixels = 0
+
+        for y in range(0, height, chunk):
+            for x in range(0, width, chunk):
+                w, h = min(chunk, width - x), min(chunk, height - y)
+                rgb = _read_chunk(
+                    slide, level, x * factor, y * factor, w * factor, h * factor
+                )
+                result = analyse_chunk(_box_reduce(rgb, factor), cell_size)
+                tissue_pixels += result["tissue_pixels"]
+                pixels += result["pixels"]
+                histograms += result["histograms"]
+                rows, cols = result["focus"].shape
+                row, col = y // cell_size, x // cell_size
+                focus_map[row:row + rows, col:col + cols] = result["focus"]
+    finally:
+        slide.close()
+
+    effective_downsample = level_downsample * factor
+    tissue_focus = focus_map[~np.isnan(focus_map)]
+    return {
+        "level": level,
+        "level_dimensions": [level_width, level_height],
+        "downsample": effective_downsample,
+        "dimensions": [width, height],
+        "cell_size": cell_size,
+        "tissue_fraction": float(tissue_pixels / pixels) if pixels else 0.0,
+        "tissue_area_px": int(round(tissue_pixels * effective_downsample**2)),
+        "focus_score": float(np.median(tissue_focus)) if tissue_focus.size else None,
+        "histograms": {
+            band: histograms[index].tolist() for index, band in enumerate("rgb")
+        },
+        "focus_map": [
+            [None if math.isnan(value) else round(float(value), 2) for value in row]
+            for row in focus_map
+        ],
+        "computed_at": datetime.utcnow().isoformat(),
+    }
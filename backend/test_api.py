@@ -8,7 +8,8 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(__file__))
 
-from app import app
+from app import SessionLocal, app
+from models import Slide
 import json
 
 def test_dzi_endpoint():
@@ -47,6 +48,61 @@ def test_info_endpoint():
         
         print("✓ Info endpoint exists and returns proper error for non-existent slides")
 
+def test_stats_endpoint():
+    """Test the precomputed slide statistics endpoint and list filters."""
+    with app.test_client() as client:
+        response = client.get('/api/slides/999/stats')
+        print(f"Non-existent slide stats: {response.status_code}")
+        assert response.status_code == 404
+
+        response = client.get('/api/slides?min_tissue=abc')
+        print(f"Invalid tissue filter: {response.status_code}")
+        assert response.status_code == 400
+
+        print("✓ Stats endpoint and list filters validate their input")
+
+def test_stats_filters():
+    """Test tissue/focus filters against a slide with precomputed statistics."""
+    session = SessionLocal()
+    slide = Slide(
+        title="stats filter test",
+        file_path="missing/stats-filter-test.tif",
+        stats_status="ready",
+        tissue_fraction=0.42,
+        focus_score=12.5,
+        slide_stats={"tissue_fraction": 0.42, "focus_score": 12.5},
+    )
+    session.add(slide)
+    session.commit()
+    slide_id = slide.id
+    session.close()
+
+    try:
+        with app.test_client() as client:
+            def listed(query):
+                response = client.get(f'/api/slides?{query}')
+                assert response.status_code == 200
+                return slide_id in [item['id'] for item in json.loads(response.data)]
+
+            assert listed('min_tissue=0.4&max_tissue=0.45')
+            assert listed('min_focus=10&stats_status=ready')
+            assert not listed('min_tissue=0.5')
+            assert not listed('max_focus=10')
+            assert not listed('stats_status=failed')
+
+            response = client.get(f'/api/slides/{slide_id}/stats')
+            assert response.status_code == 200
+            data = json.loads(response.data)
+            assert data['status'] == 'ready'
+            assert data['tissue_fraction'] == 0.42
+
+        print("✓ Stats filters select slides by tissue fraction and focus score")
+    finally:
+        session = SessionLocal()
+        session.delete(session.get(Slide, slide_id))
+        session.commit()
+        session.close()
+
 def test_health_endpoint():
     """Test the health endpoint."""
     with app.test_client() as client:
@@ -69,6 +125,8 @@ def main():
         test_dzi_endpoint()
         test_tile_endpoint()
         test_info_endpoint()
+        test_stats_endpoint()
+        test_stats_filters()
         
         print("=" * 50)
         print("✅ All API endpoints are working correctly!")
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Test script for the region-parallel pyramid builder.
+Covers level planning, TIFF tile indexing and an OpenSlide round trip.
+"""
+
+import sys
+import os
+import struct
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pyramid_builder
+from pyramid_builder import (
+    build_pyramid,
+    count_levels,
+    plan_pool_size,
+    plan_region_shrinks,
+    region_memory,
+    split_extent,
+)
+from slide_converter import convert_with_pyvips
+
+try:
+    import pyvips
+    from openslide import OpenSlide
+except ImportError:  # pragma: no cover - optional dependencies
+    pyvips = None
+    OpenSlide = None
+
+MB = 1024 * 1024
+
+
+def read_directories(path):
+    """Return (bigtiff, [{tag: values}]) for every IFD in ``path``."""
+    with open(path, "rb") as handle:
+        data = handle.read()
+    bigtiff = struct.unpack_from("<H", data, 2)[0] == 43
+    if bigtiff:
+        offset = struct.unpack_from("<Q", data, 8)[0]
+        count_fmt, entry_fmt, entry_size, inline, pointer_fmt = "<Q", "<HHQ", 20, 8, "<Q"
+    else:
+        offset = struct.unpack_from("<I", data, 4)[0]
+        count_fmt, entry_fmt, entry_size, inline, pointer_fmt = "<H", "<HHI", 12, 4, "<I"
+    sizes = {3: ("H", 2), 4: ("I", 4), 5: ("II", 8), 16: ("Q", 8)}
+
+    directories = []
+    while offset:
+        count = struct.unpack_from(count_fmt, data, offset)[0]
+        position = offset + struct.calcsize(count_fmt)
+        entries = {}
+        for _ in range(count):
+            tag, type_id, values = struct.unpack_from(entry_fmt, data, position)
+            code, size = sizes[type_id]
+            value_offset = position + struct.calcsize(entry_fmt)
+            if size * values > inline:
+                value_offset = struct.unpack_from(pointer_fmt, data, value_offset)[0]
+            entries[tag] = list(struct.unpack_from(f"<{code * values}", data, value_offset))
+            position += entry_size
+        directories.append(entries)
+        offset = struct.unpack_from(pointer_fmt, data, position)[0]
+    return bigtiff, directories, data
+
+
+def test_count_levels():
+    """Levels halve (rounding down) like libvips' tiffsave pyramid."""
+    assert count_levels(256, 256, 256) == 1
+    assert count_levels(257, 257, 256) == 2
+    assert count_levels(257, 10, 256) == 2
+    assert count_levels(3001, 1999, 256) == 5
+    assert count_levels(4097, 4097, 256) == 5
+    assert count_levels(100000, 80000, 256) == 10
+    # 任一边无法再减半时停止
+    assert count_levels(5000, 10, 512) == 4
+    assert count_levels(300, 1, 128) == 1
+    print("✓ count_levels matches the libvips pyramid depth")
+
+
+def test_split_extent():
+    """Short tails are merged so no region vanishes while shrinking."""
+    assert split_extent(3000, 1024, 4) == [(0, 1024), (1024, 1024), (2048, 952)]
+    assert split_extent(3073, 1024, 4) == [(0, 1024), (1024, 1024), (2048, 1025)]
+    assert split_extent(1024, 1024, 4) == [(0, 1024)]
+    assert split_extent(3, 1024, 4) == [(0, 3)]
+    print("✓ split_extent merges tails shorter than the shrink factor")
+
+
+def test_region_planning():
+    """A tight budget drops workers first and only shrinks regions as a last resort."""
+    full = region_memory(256 << 4, 3)
+    assert plan_region_shrinks(3, 256, 16 * full, 4) == 4
+    assert plan_region_shrinks(3, 256, full, 4) == 4
+    assert plan_region_shrinks(3, 256, full - 1, 4) == 3
+    assert plan_region_shrinks(3, 256, 1, 4) == 0
+
+    assert plan_pool_size(256 << 4, 3, 16, 500, 512 * MB) == 512 * MB // full
+    assert plan_pool_size(256 << 4, 3, 16, 2, 64 * 1024 * MB) == 2
+    assert plan_pool_size(256 << 4, 3, 16, 500, 1) == 1
+    print("✓ Region planning respects the memory budget")
+
+
+def _check_assemble(bigtiff):
+    with tempfile.TemporaryDirectory() as work_dir:
+        # level 0: 3x2 tiles split over two blobs in arbitrary order; level 1: 2x1
+        layout = {
+            "a.bin": [(0, 2, 1), (0, 0, 0), (1, 1, 0)],
+            "b.bin": [(0, 1, 0), (0, 2, 0), (0, 0, 1), (0, 1, 1), (1, 0, 0)],
+        }
+        blobs = []
+        for name, keys in layout.items():
+            path = os.path.join(work_dir, name)
+            tiles = []
+            with open(path, "wb") as blob:
+                for level, tx, ty in keys:
+                    payload = f"tile-{level}-{tx}-{ty}".encode() * (tx + 1)
+                    tiles.append((level, tx, ty, blob.tell(), len(payload)))
+                    blob.write(payload)
+            blobs.append((path, tiles))
+
+        output = Path(work_dir) / "out.tif"
+        limit = pyramid_builder._CLASSIC_TIFF_LIMIT
+        pyramid_builder._CLASSIC_TIFF_LIMIT = 0 if bigtiff else limit
+        try:
+            pyramid_builder._assemble(
+                output, blobs, [(700, 300), (350, 150)], 3, 256, None,
+                lambda *args: None,
+            )
+        finally:
+            pyramid_builder._CLASSIC_TIFF_LIMIT = limit
+
+        is_bigtiff, directories, data = read_directories(output)
+        assert is_bigtiff == bigtiff
+        assert [(d[256][0], d[257][0]) for d in directories] == [(700, 300), (350, 150)]
+        assert [d[254][0] for d in directories] == [0, 1]
+        for level, across, down in ((0, 3, 2), (1, 2, 1)):
+            offsets, lengths = directories[level][324], directories[level][325]
+            assert len(offsets) == across * down
+            for ty in range(down):
+                for tx in range(across):
+                    index = ty * across + tx
+                    payload = f"tile-{level}-{tx}-{ty}".encode() * (tx + 1)
+                    start = offsets[index]
+                    assert data[start:start + lengths[index]] == payload
+        assert not output.with_name("out.tif.partial").exists()
+
+
+def test_assemble_tile_indexing():
+    """Tiles from several blobs land at their row-major index in each level."""
+    _check_assemble(bigtiff=False)
+    _check_assemble(bigtiff=True)
+    print("✓ _assemble writes row-major tile offsets for TIFF and BigTIFF")
+
+
+def test_openslide_round_trip():
+    """A multi-region build with coarse passes opens in OpenSlide and matches the source."""
+    if pyvips is None or OpenSlide is None:
+        print("⚠ pyvips/OpenSlide 不可用，跳过往返测试")
+        return
+
+    # 3073 = 3*1024 + 1：最后 1 像素宽的区域会并入前一列
+    width, height = 3073, 1999
+    xyz = pyvips.Image.xyz(width, height)
+    source = (
+        (xyz[0] * (255 / width))
+        .bandjoin([xyz[1] * (255 / height), (xyz[0] + xyz[1]) * (255 / (width + height))])
+        .cast("uchar")
+        .copy(interpretation="srgb")
+    )
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        source_path = Path(work_dir) / "source.tif"
+        source.tiffsave(str(source_path), tile=True, compression="deflate")
+        output_path = Path(work_dir) / "out" / "pyramid.tif"
+
+        # 1024px 区域 -> 3x2 个区域，第 3、4 层由粗层级阶段生成
+        reference_path = Path(work_dir) / "reference.tif"
+        convert_with_pyvips(source_path, reference_path)
+        report = build_pyramid(
+            source_path,
+            output_path,
+            workers=2,
+            max_region_shrinks=2,
+            progress=lambda *args: None,
+        )
+        assert report.region_count == 6
+        assert report.level_count == 5
+        assert sorted(os.listdir(output_path.parent)) == ["pyramid.tif"]
+
+        vips_slide = OpenSlide(str(reference_path))
+        slide = OpenSlide(str(output_path))
+        try:
+            assert slide.properties["openslide.vendor"] == "generic-tiff"
+            assert slide.level_dimensions == vips_slide.level_dimensions
+            assert slide.level_dimensions == (
+                (3073, 1999), (1536, 999), (768, 499), (384, 249), (192, 124),
+            )
+            expected = pyvips.Image.new_from_file(str(source_path))
+            # 区域边界（1024、2048）两侧的像素
+            for x, y in ((1023, 500), (1024, 500), (2047, 1023), (2048, 1024), (3072, 1998)):
+                pixel = slide.read_region((x, y), 0, (1, 1)).convert("RGB").getpixel((0, 0))
+                reference = expected(x, y)
+                assert all(abs(a - b) <= 3 for a, b in zip(pixel, reference)), (x, y)
+            for level in range(1, slide.level_count):
+                width_l, height_l = slide.level_dimensions[level]
+                scale = 2**level
+                pixel = slide.read_region(
+                    (int(width_l / 2) * scale, int(height_l / 2) * scale), level, (1, 1)
+                ).convert("RGB").getpixel((0, 0))
+                reference = expected(int(width_l / 2) * scale, int(height_l / 2) * scale)
+                assert all(abs(a - b) <= 4 for a, b in zip(pixel, reference)), level
+        finally:
+            slide.close()
+            vips_slide.close()
+
+    print("✓ Parallel pyramid opens in OpenSlide with matching pixels")
+
+
+def main():
+    """Run all tests."""
+    print("Testing pyramid builder...")
+    print("=" * 50)
+
+    try:
+        test_count_levels()
+        test_split_extent()
+        test_region_planning()
+        test_assemble_tile_indexing()
+        test_openslide_round_trip()
+
+        print("=" * 50)
+        print("✅ All pyramid builder tests passed!")
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Test script for the slide QC analytics.
+Exercises the NumPy chunk statistics in ``slide_stats`` on synthetic arrays (no
+database needed) and, when pyvips/OpenSlide are installed, on generated slides.
+"""
+
+import sys
+import os
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.dirname(__file__))
+
+import numpy as np
+
+from slide_stats import _box_reduce, _cell_view, analyse_chunk, compute_slide_stats
+
+try:
+    import pyvips
+    from openslide import OpenSlide
+except ImportError:  # pragma: no cover - optional dependencies
+    pyvips = None
+    OpenSlide = None
+
+TISSUE_PINK = (200, 100, 150)
+TISSUE_PURPLE = (120, 40, 110)
+
+
+def test_cell_view_padding():
+    """Non-multiple sizes are padded with the fill value into whole cells."""
+    values = np.arange(5 * 7, dtype=np.float32).reshape(5, 7)
+    cells = _cell_view(values, 4, np.nan)
+
+    assert cells.shape == (2, 2, 16)
+    assert np.array_equal(cells[0, 0].reshape(4, 4), values[:4, :4])
+    corner = cells[1, 1].reshape(4, 4)
+    assert np.array_equal(corner[:1, :3], values[4:, 4:])
+    assert np.isnan(corner[1:, :]).all() and np.isnan(corner[:, 3]).all()
+    assert np.count_nonzero(~np.isnan(cells)) == values.size
+    print("✓ _cell_view pads partial cells with the fill value")
+
+
+def test_box_reduce_drops_partial_blocks():
+    """Blocks are averaged and trailing partial blocks dropped, like libvips shrink."""
+    rgb = np.zeros((5, 7, 3), dtype=np.uint8)
+    rgb[:2, :2] = (10, 20, 30)
+    rgb[:2, 2:4] = (0, 0, 3)
+    reduced = _box_reduce(rgb, 2)
+
+    assert reduced.shape == (2, 3, 3)
+    assert tuple(reduced[0, 0]) == (10, 20, 30)
+    assert tuple(reduced[0, 1]) == (0, 0, 3)
+    assert _box_reduce(rgb, 1) is rgb
+    print("✓ _box_reduce averages whole blocks only")
+
+
+def test_white_chunk_has_no_tissue():
+    """A blank (background) chunk yields no tissue, empty histograms and no focus."""
+    result = analyse_chunk(np.full((100, 130, 3), 255, dtype=np.uint8), 32)
+
+    assert result["tissue_pixels"] == 0
+    assert result["pixels"] == 100 * 130
+    assert result["histograms"].shape == (3, 256)
+    assert result["histograms"].sum() == 0
+    assert result["focus"].shape == (4, 5)
+    assert np.isnan(result["focus"]).all()
+    print("✓ White chunks contain no tissue")
+
+
+def test_saturated_patch_fraction_and_histograms():
+    """A stained patch on white counts exactly its pixels into the right bins."""
+    rgb = np.full((128, 128, 3), 255, dtype=np.uint8)
+    rgb[:64, :32] = TISSUE_PINK
+    result = analyse_chunk(rgb, 32)
+
+    assert result["tissue_pixels"] == 64 * 32
+    assert result["tissue_pixels"] / result["pixels"] == 0.125
+    for band, value in enumerate(TISSUE_PINK):
+        histogram = result["histograms"][band]
+        assert histogram[value] == 64 * 32
+        assert histogram.sum() == 64 * 32
+    # 只有含组织的两个网格有清晰度值
+    assert np.count_nonzero(~np.isnan(result["focus"])) == 2
+    print("✓ Stained patches give the expected tissue fraction and bin counts")
+
+
+def test_sharp_patch_scores_higher_than_blurred():
+    """Laplacian variance ranks a crisp pattern above its blurred version."""
+    yy, xx = np.mgrid[0:64, 0:64]
+    checker = ((yy // 2 + xx // 2) % 2).astype(bool)
+    sharp = np.where(checker[..., None], TISSUE_PINK, TISSUE_PURPLE).astype(np.float32)
+
+    # 8x8 盒式模糊
+    padded = np.pad(sharp, ((4, 4), (4, 4), (0, 0)), mode="edge")
+    blurred = np.zeros_like(sharp)
+    for dy in range(8):
+        for dx in range(8):
+            blurred += padded[dy:dy + 64, dx:dx + 64]
+    blurred /= 64
+
+    rgb = np.concatenate([sharp, blurred], axis=1).round().astype(np.uint8)
+    focus = analyse_chunk(rgb, 64)["focus"]
+
+    assert focus.shape == (1, 2)
+    assert not np.isnan(focus).any()
+    assert focus[0, 0] > 10 * focus[0, 1]
+    print("✓ Sharp tissue scores higher focus than blurred tissue")
+
+
+def test_flat_patch_edge_is_ignored():
+    """A flat stained patch on white scores far below textured tissue.
+
+    Only the patch outline has any Laplacian response; the eroded tissue mask
+    keeps that tissue/background edge out of the focus map.
+    """
+    rng = np.random.default_rng(0)
+    rgb = np.full((64, 128, 3), 255, dtype=np.uint8)
+    rgb[8:56, 8:56] = TISSUE_PINK
+    noise = rng.integers(-12, 13, size=(64, 64, 1))
+    rgb[:, 64:] = np.clip(np.array(TISSUE_PINK) + noise, 0, 255)
+    focus = analyse_chunk(rgb, 64)["focus"]
+
+    assert focus.shape == (1, 2)
+    assert not np.isnan(focus).any()
+    assert focus[0, 0] < 0.01 * focus[0, 1]
+    print("✓ Tissue/background edges do not count as focus")
+
+
+def _synthetic_tissue(width, height):
+    """Stained 16px blocks with pixel noise on the left 3/4, white on the right."""
+    rng = np.random.default_rng(1)
+    blocks = rng.random((height // 16 + 1, width // 16 + 1))
+    weight = np.kron(blocks, np.ones((16, 16)))[:height, :width, None]
+    rgb = weight * np.array(TISSUE_PINK) + (1 - weight) * np.array(TISSUE_PURPLE)
+    rgb += rng.normal(0, 6, size=rgb.shape)
+    rgb[:, width * 3 // 4:] = 255
+    return np.clip(rgb, 0, 255).astype(np.uint8)
+
+
+def test_pyramid_and_flat_file_agree():
+    """A single-level file and a pyramid of the same image are analysed at one scale."""
+    if pyvips is None or OpenSlide is None:
+        print("⚠ pyvips/OpenSlide 不可用，跳过金字塔一致性测试")
+        return
+
+    rgb = _synthetic_tissue(4100, 3000)
+    image = pyvips.Image.new_from_array(rgb).copy(interpretation="srgb")
+    with tempfile.TemporaryDirectory() as work_dir:
+        flat_path = Path(work_dir) / "flat.tif"
+        pyramid_path = Path(work_dir) / "pyramid.tif"
+        image.tiffsave(str(flat_path), tile=True, compression="deflate")
+        image.tiffsave(str(pyramid_path), tile=True, pyramid=True, compression="deflate")
+
+        flat = compute_slide_stats(flat_path, downsample=8, cell_size=32)
+        pyramid = compute_slide_stats(pyramid_path, downsample=8, cell_size=32)
+
+    assert flat["level"] == 0 and pyramid["level"] == 3
+    assert flat["dimensions"] == pyramid["dimensions"] == [512, 375]
+    assert abs(flat["downsample"] - 8) < 0.01 and abs(pyramid["downsample"] - 8) < 0.01
+    assert abs(flat["tissue_fraction"] - pyramid["tissue_fraction"]) < 0.01
+    assert abs(flat["tissue_fraction"] - 0.75) < 0.02
+    assert flat["focus_score"] > 0
+    assert abs(flat["focus_score"] - pyramid["focus_score"]) < 0.05 * flat["focus_score"]
+    print("✓ Pyramid and single-level files give the same focus score")
+
+
+def main():
+    """Run all tests."""
+    print("Testing slide analytics...")
+    print("=" * 50)
+
+    try:
+        test_cell_view_padding()
+        test_box_reduce_drops_partial_blocks()
+        test_white_chunk_has_no_tissue()
+        test_saturated_patch_fraction_and_histograms()
+        test_sharp_patch_scores_higher_than_blurred()
+        test_flat_patch_edge_is_ignored()
+        test_pyramid_and_flat_file_agree()
+
+        print("=" * 50)
+        print("✅ All slide analytics tests passed!")
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()